@@ -4,12 +4,12 @@ import torch.nn as nn
 import torch
 import torch.nn.functional as F
 import torch.nn.init as init
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 
 def init_weights(m):
-    classname = m.__class__.__name__
-    if classname.find('Conv2d') != -1:
+    if isinstance(m, nn.Conv2d):
         torch.nn.init.normal_(m.weight.data, 0.0, 0.05)
-    elif classname.find('Linear') != -1:
+    elif isinstance(m, nn.Linear):
         torch.nn.init.normal_(m.weight.data, 0.0, 0.05)
         torch.nn.init.constant_(m.bias.data, 0.0)
 
@@ -20,7 +20,7 @@ def reparameterize(mu, logvar):
 
 def kaiming_init(m):
     if isinstance(m, (nn.Linear, nn.Conv2d)):
-        init.kaiming_normal(m.weight)
+        init.kaiming_normal_(m.weight)
         if m.bias is not None:
             m.bias.data.fill_(0)
     elif isinstance(m, (nn.BatchNorm1d, nn.BatchNorm2d)):
@@ -28,18 +28,33 @@ def kaiming_init(m):
         if m.bias is not None:
             m.bias.data.fill_(0)
 
+def fuse_conv_bn(model):
+    """Fold eval-mode BatchNorm2d layers into the (transposed) convolution that precedes them."""
+    for name, block in model.named_children():
+        if not isinstance(block, nn.Sequential):
+            continue
+        layers = []
+        for m in block:
+            if isinstance(m, nn.BatchNorm2d) and layers and isinstance(layers[-1], (nn.Conv2d, nn.ConvTranspose2d)):
+                layers[-1] = fuse_conv_bn_eval(layers[-1], m, transpose=isinstance(layers[-1], nn.ConvTranspose2d))
+            else:
+                layers.append(m)
+        setattr(model, name, nn.Sequential(*layers).train(block.training))
+    return model
+
 class View(nn.Module):
-    def __init__(self, size):
+    def __init__(self, size, memory_format=torch.contiguous_format):
         super(View, self).__init__()
         self.size = size
+        self.memory_format = memory_format
 
     def forward(self, tensor):
-        return tensor.view(self.size)
+        return tensor.view(self.size).contiguous(memory_format=self.memory_format)
 
 class BetaVAE(nn.Module):
     """Model proposed in original beta-VAE paper(Higgins et al, ICLR, 2017)."""
 
-    def __init__(self, z_dim=10, nc=3, img_size=28):
+    def __init__(self, z_dim=10, nc=3, img_size=28, weight_init=True):
         super(BetaVAE, self).__init__()
         self.z_dim = z_dim
         self.nc = nc
@@ -60,7 +75,7 @@ class BetaVAE(nn.Module):
             )
             self.decoder = nn.Sequential(
                 nn.Linear(z_dim, 256),               # B, 256
-                View((-1, 256, 1, 1)),               # B, 256,  1,  1
+                View((-1, 256, 1, 1), torch.channels_last), # B, 256,  1,  1
                 nn.ReLU(True),
                 nn.ConvTranspose2d(256, 64, 4),      # B,  64,  4,  4
                 nn.ReLU(True),
@@ -87,7 +102,7 @@ class BetaVAE(nn.Module):
             )
             self.decoder = nn.Sequential(
                 nn.Linear(z_dim, 256),               # B, 256
-                View((-1, 256, 1, 1)),               # B, 256,  1,  1
+                View((-1, 256, 1, 1), torch.channels_last), # B, 256,  1,  1
                 nn.ReLU(True),
                 nn.ConvTranspose2d(256, 64, 4, 1),   # B,  64,  4,  4
                 nn.ReLU(True),
@@ -98,7 +113,10 @@ class BetaVAE(nn.Module):
                 nn.ConvTranspose2d(32, nc, 4, 2, 1),  # B, nc, 28, 28
             )            
             
-        self.weight_init()
+        # Skip the initialization when a state dict is loaded right after construction
+        if weight_init:
+            self.weight_init()
+        self.to(memory_format=torch.channels_last)
 
     def weight_init(self):
         for block in self._modules:
@@ -132,6 +150,8 @@ class ConvEncoder(nn.Module):
         super(ConvEncoder, self).__init__()
         self.num_filters = num_filters
         self.img_size = img_size
+        # Only one branch is built, the other stays None so forward's check is resolved once when scripted
+        self.main = self.fc = self.model_enc = self.fc_mean = None
         if self.img_size == 32:
             self.main = nn.Sequential(
                 nn.Conv2d(int(c_dim), self.num_filters, 4, 2, 1, bias=False),
@@ -178,28 +198,29 @@ class ConvEncoder(nn.Module):
             self.model_enc = nn.Sequential(
                 nn.Conv2d(int(c_dim), num_filters, 4, stride=2, padding=1),
                 nn.BatchNorm2d(num_filters),
-                nn.ReLU(),
+                nn.ReLU(True),
                 nn.Conv2d(num_filters, num_filters, 4, stride=2, padding=1),
                 nn.BatchNorm2d(num_filters),
-                nn.ReLU(),
+                nn.ReLU(True),
                 nn.ZeroPad2d((1, 2, 1, 2)),
                 nn.Conv2d(num_filters, num_filters, 4, stride=1, padding=0),
                 nn.BatchNorm2d(num_filters),
-                nn.ReLU(),
+                nn.ReLU(True),
             )
 
             self.fc_mean = nn.Linear(int(num_filters*img_size*img_size/16),z_dim)
         self.norm_ae_flag = norm_ae_flag
+        self.to(memory_format=torch.channels_last)
 
     def forward(self, x):
          # 2 hidden layers encoder
-        if self.img_size == 32 or self.img_size == 64:
+        if self.main is not None:
             x = self.main(x)
-            x = x.view(x.size(0),-1)
+            x = x.reshape(x.size(0),-1)
             z_mean = self.fc(x)
         else:
             x = self.model_enc(x)
-            x = x.view(x.size(0),-1)
+            x = x.reshape(x.size(0),-1)
             z_mean = self.fc_mean(x)
         if self.norm_ae_flag == 1:
             z_mean = F.normalize(z_mean)
@@ -211,8 +232,9 @@ class ConvDecoder(nn.Module):
         super(ConvDecoder, self).__init__()
         self.num_filters = num_filters
         self.img_size = img_size
+        self.proj = self.main = self.fc = self.model = None
         if self.img_size == 28:
-            self.img_4 = img_size/4
+            self.img_4 = int(img_size/4)
         elif self.img_size == 32:
             self.img_4 = 9
         elif self.img_size == 64:
@@ -221,7 +243,7 @@ class ConvDecoder(nn.Module):
         if self.img_size == 32 or self.img_size == 64:
             self.proj = nn.Sequential(
                 nn.Linear(z_dim, self.num_filters * self.img_4 * self.img_4),
-                nn.ReLU()
+                nn.ReLU(True)
             )
             self.main = nn.Sequential(
                 # 9x9
@@ -248,36 +270,37 @@ class ConvDecoder(nn.Module):
                 # 15x15
                 # H/W*2 + 2
                 nn.ConvTranspose2d(self.num_filters, int(c_dim), 4, stride=2),
-                nn.Sigmoid()
             )
         else:
             self.fc = nn.Sequential(
                     nn.Linear(z_dim,int(self.img_4*self.img_4*num_filters)),
-                    nn.ReLU(),
+                    nn.ReLU(True),
                     )
 
             self.model = nn.Sequential(
                 nn.ConvTranspose2d(num_filters, num_filters, 4, stride=1, padding=1),
                 nn.BatchNorm2d(num_filters),
-                nn.ReLU(),
+                nn.ReLU(True),
                 nn.ConvTranspose2d(num_filters, num_filters, 4, stride=2, padding=2),
                 nn.BatchNorm2d(num_filters),
-                nn.ReLU(),
+                nn.ReLU(True),
                 nn.ConvTranspose2d(num_filters, int(c_dim), 4, stride=2, padding=1),
-                nn.Sigmoid()
             )
-
+        self.to(memory_format=torch.channels_last)
 
     def forward(self, z):
+        # The output Sigmoid is applied in place on the last transposed convolution
         batch_size = z.size()[0]
-        if self.img_size == 32 or self.img_size == 64:
+        if self.main is not None:
             temp_var = self.proj(z)
-            temp_var = temp_var.view(batch_size,self.num_filters,int(self.img_4),int(self.img_4))
-            img= self.main(temp_var)
+            temp_var = temp_var.view(batch_size,self.num_filters,self.img_4,self.img_4)
+            temp_var = temp_var.contiguous(memory_format=torch.channels_last)
+            img= torch.sigmoid_(self.main(temp_var))
         else:
             temp_var = self.fc(z)
-            temp_var = temp_var.view(batch_size,self.num_filters,int(self.img_4),int(self.img_4))
-            img= self.model(temp_var)
+            temp_var = temp_var.view(batch_size,self.num_filters,self.img_4,self.img_4)
+            temp_var = temp_var.contiguous(memory_format=torch.channels_last)
+            img= torch.sigmoid_(self.model(temp_var))
         return img
 
 
@@ -323,14 +346,14 @@ class ConvEncoder_old(nn.Module):
             self.model_enc = nn.Sequential(
                 nn.Conv2d(int(c_dim), num_filters, 4, stride=2, padding=1),
                 nn.BatchNorm2d(num_filters),
-                nn.ReLU(),
+                nn.ReLU(True),
                 nn.Conv2d(num_filters, num_filters, 4, stride=2, padding=1),
                 nn.BatchNorm2d(num_filters),
-                nn.ReLU(),
+                nn.ReLU(True),
                 nn.ZeroPad2d((1, 2, 1, 2)),
                 nn.Conv2d(num_filters, num_filters, 4, stride=1, padding=0),
                 nn.BatchNorm2d(num_filters),
-                nn.ReLU(),
+                nn.ReLU(True),
             )
 
             self.fc_mean = nn.Linear(int(num_filters*img_size*img_size/16),z_dim)
@@ -364,7 +387,7 @@ class ConvDecoder_old(nn.Module):
         if self.img_size == 32:
             self.proj = nn.Sequential(
                 nn.Linear(z_dim, self.num_filters * self.img_4 * self.img_4),
-                nn.ReLU()
+                nn.ReLU(True)
             )
             self.main = nn.Sequential(
                 # 9x9
@@ -400,16 +423,16 @@ class ConvDecoder_old(nn.Module):
         else:
             self.fc = nn.Sequential(
                     nn.Linear(z_dim,int(self.img_4*self.img_4*num_filters)),
-                    nn.ReLU(),
+                    nn.ReLU(True),
                     )
 
             self.model = nn.Sequential(
                 nn.ConvTranspose2d(num_filters, num_filters, 4, stride=1, padding=1),
                 nn.BatchNorm2d(num_filters),
-                nn.ReLU(),
+                nn.ReLU(True),
                 nn.ConvTranspose2d(num_filters, num_filters, 4, stride=2, padding=2),
                 nn.BatchNorm2d(num_filters),
-                nn.ReLU(),
+                nn.ReLU(True),
                 nn.ConvTranspose2d(num_filters, int(c_dim), 4, stride=2, padding=1),
                 nn.Sigmoid()
             )
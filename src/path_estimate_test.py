@@ -184,7 +184,7 @@ encoder_cae.load_state_dict(modelCAE_state['encoder'])
 decoder_cae.load_state_dict(modelCAE_state['decoder'])
 
 # Load beta-VAE model
-bvae = BetaVAE(z_dim=latent_dim, nc=channels, img_size = image_dim).to(device)
+bvae = BetaVAE(z_dim=latent_dim, nc=channels, img_size = image_dim, weight_init=False).to(device)
 Beta = 5
 modelBVAE_state = torch.load(save_dir_BVAE + 'BVAE_{}_Z{}_Beta{}.pt'.format(dataset, latent_dim, Beta),  map_location=device)
 bvae.load_state_dict(modelBVAE_state['bvae'])
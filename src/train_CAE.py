@@ -12,6 +12,7 @@ from model.transop import TransOp_expm
 from model.l1_inference import infer_coefficients
 from model.autoencoder import ConvEncoder, ConvDecoder, init_weights
 from util.dataloader import load_mnist, load_cifar10, load_celeba, load_celeba64, load_fmnist
+from util.utils import bf16_autocast
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-Z', '--latent_dim', default=10, type=int, help="Dimension of latent space")
@@ -91,16 +92,17 @@ for j in range(ae_epochs):
         x0.requires_grad_(True)
         x0.retain_grad()
 
-        z0 = encoder(x0)
-        x0_hat = decoder(z0)
+        with bf16_autocast(device):
+            z0 = encoder(x0)
+            x0_hat = decoder(z0)
 
-        # Recon loss
-        ae_loss = F.mse_loss(x0_hat, x0, reduction='mean')
+            # Recon loss
+            ae_loss = F.mse_loss(x0_hat, x0, reduction='mean')
 
         # jacobian wrt the input
-        z0.backward(torch.ones(z0.size()).to(device), retain_graph=True)
+        z0.backward(torch.ones_like(z0), retain_graph=True)
         jacobian = torch.sqrt(torch.sum(torch.pow(x0.grad, 2)))
-        x0.grad.data.zero_()
+        x0.grad = None
         x0.requires_grad_(False)
 
         # Total loss, the sum of the two loss terms, with weight applied to second term
@@ -116,10 +118,11 @@ for j in range(ae_epochs):
         for idx, batch in enumerate(test_loader):
             x0, _, __ = batch
             x0 = x0.to(device)
-            z0 = encoder(x0)
-            x0_hat = decoder(z0)
+            with bf16_autocast(device):
+                z0 = encoder(x0)
+                x0_hat = decoder(z0)
 
-            ae_loss = F.mse_loss(x0_hat, x0, reduction='mean')
+                ae_loss = F.mse_loss(x0_hat, x0, reduction='mean')
 
             test_error[idx] = ae_loss
     print("AE Pre-train epoch {} of {}: Test loss: {:.4E}".format(j+1, ae_epochs, torch.mean(test_error)))
@@ -141,37 +144,36 @@ x = x.to(device)
 def find_jacobian(encoder, x):
     # Require gradient for image for computing Jacobian
     x.requires_grad_(True)
-    x.retain_grad()
     z = encoder(x)
 
-    jacobian = torch.zeros((*x.shape, z.shape[1]))
+    jacobian = torch.empty((*x.shape, z.shape[1]), device=device)
     for d in range(latent_dim):
-        x_hat = decoder(z)
-        one_code = torch.zeros(z.size())
-        one_code[:, d] = 1
-        z.backward(one_code.to(device), retain_graph=True)
-        jacobian[:, :, :, :, d] = x.grad.detach()
-        x.grad.data.zero_()
+        # Only keep the encoder graph alive until the last latent dimension
+        grad_x, = torch.autograd.grad(z[:, d].sum(), x, retain_graph=d < latent_dim - 1)
+        jacobian[:, :, :, :, d] = grad_x
     return jacobian
 
 jacobian = find_jacobian(encoder, x)
 
+_, _, Vh = torch.linalg.svd(jacobian.reshape(num_samples, -1, latent_dim), full_matrices=False)
+coeff_pos = torch.linspace(0, coeff_range, 5, device=device)
+coeff_neg = torch.linspace(-coeff_range, 0, 5, device=device)
+
 for n in range(num_samples):
-    u, s, v = torch.svd(jacobian[n].reshape(-1, latent_dim))
+    # Vh[n] is v.T, so direction d is its column d
+    directions = Vh[n]
     z = encoder(x)[n]
     fig, ax = plt.subplots(nrows=5, ncols=11, figsize=(25, 15))
 
     for d in range(num_directions):
         ax[d, 5].imshow(x[n].permute(1, 2, 0).detach().cpu().squeeze().numpy())
-        direction = v.T[:, d].to(device)
+        direction = directions[:, d]
 
-        coeff = torch.linspace(0, coeff_range, 5).float().to(device)
-        x_hat = decoder(z[None, :] + coeff[:, None]*direction).detach().cpu()
+        x_hat = decoder(z[None, :] + coeff_pos[:, None]*direction).detach().cpu()
         for k in range(len(x_hat)):
             ax[d, 6+k].imshow(x_hat[k].permute(1, 2, 0).squeeze().numpy())
 
-        coeff = torch.linspace(-coeff_range, 0, 5).float().to(device)
-        x_hat = decoder(z[None, :] + coeff[:, None]*direction).detach().cpu()
+        x_hat = decoder(z[None, :] + coeff_neg[:, None]*direction).detach().cpu()
         for k in range(len(x_hat)):
             ax[d, k].imshow(x_hat[k].permute(1, 2, 0).squeeze().numpy())
 
@@ -110,3 +110,7 @@ def build_nn_graph(train_loader, latent_dim, encoder, neighbor_count=5, device='
 
     nbrs = NearestNeighbors(n_neighbors=neighbor_count+1, algorithm='ball_tree').fit(latent_points)
     return nbrs.kneighbors(latent_points, neighbor_count+1, return_distance=False)[:, 1:]
+
+# bfloat16 keeps the float32 exponent range, so no GradScaler is needed
+def bf16_autocast(device):
+    return torch.amp.autocast(device_type='cuda', dtype=torch.bfloat16, enabled=device.type == 'cuda')